@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按总权益维护的排行榜
+供 server_multiplayer.py 使用，不依赖 Flask
+"""
+
+import bisect
+from collections import Counter
+
+
+class Leaderboard:
+    """按当前市场价格下的总权益（现金 + 持仓 * 市场价格）维护的有序排名。
+
+    交易、平仓只更新单个用户（二分查找定位）。市场价格变化时所有持仓用户的
+    权益都会变化，需按原顺序重算全部权益后原地重排：列表近乎有序，Timsort 接近 O(N)。
+    查询单个用户排名为 O(log N)；前K名最多返回K条，与第K名并列但未列出的人数单独统计。
+    """
+    def __init__(self):
+        self.keys = []  # 有序列表 [(-total_equity, user_id)]
+        self.entries = {}  # {user_id: (-total_equity, user_id)}
+        self.price = None  # 当前排名所基于的市场价格
+        self.equity_counts = Counter()  # {-total_equity: 人数}，用于统计并列人数
+
+    def _key(self, user_id, user_data, price):
+        total_equity = user_data.get('cash', 0) + (user_data.get('demand', 0) * price)
+        return (-total_equity, user_id)
+
+    def remove(self, user_id):
+        key = self.entries.pop(user_id, None)
+        if key is not None:
+            index = bisect.bisect_left(self.keys, key)
+            del self.keys[index]
+            self._uncount(key[0])
+
+    def _uncount(self, neg_equity):
+        self.equity_counts[neg_equity] -= 1
+        if not self.equity_counts[neg_equity]:
+            del self.equity_counts[neg_equity]
+
+    def update(self, user_id, user_data, price):
+        self.remove(user_id)
+        key = self._key(user_id, user_data, price)
+        bisect.insort(self.keys, key)
+        self.entries[user_id] = key
+        self.equity_counts[key[0]] += 1
+
+    def rebuild(self, users, price, excluded=()):
+        self.entries = {
+            user_id: self._key(user_id, user_data, price)
+            for user_id, user_data in users.items()
+            if user_id not in excluded
+        }
+        self.keys = sorted(self.entries.values())
+        self.equity_counts = Counter(key[0] for key in self.keys)
+        self.price = price
+
+    def reprice(self, users, price):
+        # 按原顺序重算权益，再对近乎有序的列表原地排序
+        keys = self.keys
+        for index, (_, user_id) in enumerate(keys):
+            keys[index] = self._key(user_id, users[user_id], price)
+        keys.sort()
+        self.entries = {key[1]: key for key in keys}
+        self.equity_counts = Counter(key[0] for key in keys)
+        self.price = price
+
+    def rank(self, user_id):
+        # 并列排名（1, 1, 3, ...）：排名为权益严格更高的人数 + 1
+        key = self.entries.get(user_id)
+        if key is None:
+            return None
+        return bisect.bisect_left(self.keys, (key[0],)) + 1
+
+    def position(self, user_id):
+        # 在有序列表中的下标（从0开始），与 top() 返回的顺序一致
+        key = self.entries.get(user_id)
+        if key is None:
+            return None
+        return bisect.bisect_left(self.keys, key)
+
+    def top(self, k=None):
+        # 返回前k条（并列排名），与第k名并列的其余用户见 tied_at_cutoff()
+        keys = self.keys if k is None else self.keys[:k]
+        result = []
+        rank = 0
+        prev_neg_equity = None
+        for index, (neg_equity, user_id) in enumerate(keys):
+            if neg_equity != prev_neg_equity:
+                rank = index + 1
+                prev_neg_equity = neg_equity
+            result.append((rank, user_id, -neg_equity))
+        return result
+
+    def tied_at_cutoff(self, k):
+        # 与第k名并列、但因截断未出现在 top(k) 中的人数
+        if k is None or len(self.keys) <= k or k <= 0:
+            return 0
+        neg_equity = self.keys[k - 1][0]
+        first = bisect.bisect_left(self.keys, (neg_equity,))
+        return self.equity_counts[neg_equity] - (k - first)
+
+    def __len__(self):
+        return len(self.keys)
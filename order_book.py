@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+限价订单簿（价格档位 + 每档先进先出队列）
+供 server_multiplayer.py 的限价单模式使用，不依赖 Flask
+"""
+
+import heapq
+from collections import OrderedDict, namedtuple
+
+BUY = 'BUY'
+SELL = 'SELL'
+
+# 一笔成交（side 为挂单方/maker 的方向，price 为挂单价格）
+Fill = namedtuple('Fill', ['order_id', 'owner', 'side', 'price', 'qty'])
+
+
+class Order:
+    __slots__ = ('order_id', 'owner', 'side', 'price', 'qty', 'time')
+
+    def __init__(self, order_id, owner, side, price, qty, time=0):
+        self.order_id = order_id
+        self.owner = owner
+        self.side = side
+        self.price = price
+        self.qty = qty
+        self.time = time
+
+    def to_dict(self):
+        return {
+            'order_id': self.order_id,
+            'side': self.side,
+            'price': self.price,
+            'qty': self.qty,
+            'time': self.time
+        }
+
+
+class PriceLevel:
+    __slots__ = ('orders', 'qty')
+
+    def __init__(self):
+        self.orders = OrderedDict()  # {order_id: Order}，按到达顺序排列
+        self.qty = 0  # 本档挂单总量
+
+
+class OrderBook:
+    """价格档位订单簿。
+
+    每个价格档位是一个 FIFO 队列（OrderedDict），按订单ID撤单为 O(1)；
+    两侧各缓存最优价格，best_bid()/best_ask() 为 O(1)。档位价格另存于堆中（惰性删除，
+    用集合保证同一价格最多入堆一次）：新建档位为 O(log L)；最优档位被清空时，
+    从堆顶弹出已失效的价格找到下一档，每次弹出 O(log L)（L 为档位数）。
+    """
+    def __init__(self):
+        self.bids = {}  # {price: PriceLevel}
+        self.asks = {}  # {price: PriceLevel}
+        self.bid_prices = []  # 最大堆（存负价格）
+        self.ask_prices = []  # 最小堆
+        self.bid_heap_set = set()  # bid_prices 中已有的价格
+        self.ask_heap_set = set()  # ask_prices 中已有的价格
+        self.best_bid_price = None  # 缓存的最优买价
+        self.best_ask_price = None  # 缓存的最优卖价
+        self.orders = {}  # {order_id: Order}
+        self.owner_orders = {}  # {owner: {order_id: None}}，按挂单顺序
+        self.next_order_id = 1
+
+    def __len__(self):
+        return len(self.orders)
+
+    # --- 最优价格 ---
+    def best_bid(self):
+        return self.best_bid_price
+
+    def best_ask(self):
+        return self.best_ask_price
+
+    def _next_best_bid(self):
+        heap = self.bid_prices
+        while heap and -heap[0] not in self.bids:
+            self.bid_heap_set.discard(-heapq.heappop(heap))
+        return -heap[0] if heap else None
+
+    def _next_best_ask(self):
+        heap = self.ask_prices
+        while heap and heap[0] not in self.asks:
+            self.ask_heap_set.discard(heapq.heappop(heap))
+        return heap[0] if heap else None
+
+    # --- 挂单 / 撤单 ---
+    def _add(self, order):
+        if order.side == BUY:
+            levels = self.bids
+            if order.price not in levels:
+                levels[order.price] = PriceLevel()
+                if order.price not in self.bid_heap_set:
+                    self.bid_heap_set.add(order.price)
+                    heapq.heappush(self.bid_prices, -order.price)
+                if self.best_bid_price is None or order.price > self.best_bid_price:
+                    self.best_bid_price = order.price
+        else:
+            levels = self.asks
+            if order.price not in levels:
+                levels[order.price] = PriceLevel()
+                if order.price not in self.ask_heap_set:
+                    self.ask_heap_set.add(order.price)
+                    heapq.heappush(self.ask_prices, order.price)
+                if self.best_ask_price is None or order.price < self.best_ask_price:
+                    self.best_ask_price = order.price
+        level = levels[order.price]
+        level.orders[order.order_id] = order
+        level.qty += order.qty
+        self.orders[order.order_id] = order
+        self.owner_orders.setdefault(order.owner, {})[order.order_id] = None
+
+    def _remove(self, order):
+        levels = self.bids if order.side == BUY else self.asks
+        level = levels[order.price]
+        del level.orders[order.order_id]
+        level.qty -= order.qty
+        if not level.orders:
+            del levels[order.price]  # 堆中的价格保留，档位重建时不再重复入堆
+            # 最优档位被清空时，从堆中找下一档
+            if order.side == BUY and order.price == self.best_bid_price:
+                self.best_bid_price = self._next_best_bid()
+            elif order.side == SELL and order.price == self.best_ask_price:
+                self.best_ask_price = self._next_best_ask()
+        del self.orders[order.order_id]
+        owned = self.owner_orders.get(order.owner)
+        if owned is not None:
+            owned.pop(order.order_id, None)
+            if not owned:
+                del self.owner_orders[order.owner]
+
+    def cancel(self, order_id):
+        order = self.orders.get(order_id)
+        if order is None:
+            return None
+        self._remove(order)
+        return order
+
+    def cancel_owner(self, owner):
+        cancelled = []
+        for order_id in list(self.owner_orders.get(owner, ())):
+            cancelled.append(self.cancel(order_id))
+        return cancelled
+
+    def clear(self):
+        self.__init__()
+
+    # --- 撮合 ---
+    def match(self, side, qty, limit_price=None, owner=None):
+        """用一笔 side 方向、数量 qty 的进入订单与对手方挂单撮合。
+
+        limit_price 为 None 时不限价。成交价为挂单价格，同一 owner 的挂单
+        不与自己成交（撤销旧挂单）。返回 (成交列表, 未成交数量, 被撤销的自成交挂单)。
+        """
+        fills = []
+        cancelled = []
+        if side == BUY:
+            levels, best = self.asks, self.best_ask
+            crosses = lambda price: limit_price is None or price <= limit_price
+        else:
+            levels, best = self.bids, self.best_bid
+            crosses = lambda price: limit_price is None or price >= limit_price
+
+        while qty > 0:
+            price = best()
+            if price is None or not crosses(price):
+                break
+            level = levels[price]
+            while qty > 0 and level.orders:
+                maker = next(iter(level.orders.values()))
+                if owner is not None and maker.owner == owner:
+                    self._remove(maker)
+                    cancelled.append(maker)
+                    continue
+                fill_qty = min(qty, maker.qty)
+                fills.append(Fill(maker.order_id, maker.owner, maker.side, price, fill_qty))
+                qty -= fill_qty
+                if fill_qty == maker.qty:
+                    self._remove(maker)
+                else:
+                    maker.qty -= fill_qty
+                    level.qty -= fill_qty
+            # 档位被吃完时 _remove 已删除该档位，best() 会返回下一档
+        return fills, qty, cancelled
+
+    def submit_limit(self, owner, side, qty, price, time=0):
+        """提交限价单：先撮合，剩余部分按价格挂入订单簿。返回 (成交列表, 挂单或None, 被撤销的自成交挂单)。"""
+        fills, remaining, cancelled = self.match(side, qty, price, owner)
+        order = None
+        if remaining > 0:
+            order = Order(self.next_order_id, owner, side, price, remaining, time)
+            self.next_order_id += 1
+            self._add(order)
+        return fills, order, cancelled
+
+    # --- 查询 ---
+    def get_owner_orders(self, owner):
+        return [self.orders[order_id].to_dict() for order_id in self.owner_orders.get(owner, ())]
+
+    def depth(self, levels=5):
+        bids = heapq.nlargest(levels, self.bids)
+        asks = heapq.nsmallest(levels, self.asks)
+        return {
+            'bids': [[price, self.bids[price].qty] for price in bids],
+            'asks': [[price, self.asks[price].qty] for price in asks]
+        }
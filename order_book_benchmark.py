@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+订单簿撮合吞吐量测试（每秒处理订单数）
+用法: python order_book_benchmark.py [订单数]
+"""
+
+import random
+import sys
+import time
+
+from order_book import OrderBook, BUY, SELL
+
+MID_PRICE = 500
+DEPTHS = [1, 10, 100, 1000]  # 每侧预先挂单的价格档位数
+ORDERS_PER_LEVEL = 5
+
+
+def build_book(depth):
+    book = OrderBook()
+    for i in range(depth):
+        for j in range(ORDERS_PER_LEVEL):
+            book.submit_limit(f'maker{j}', BUY, 10, MID_PRICE - 1 - i)
+            book.submit_limit(f'maker{j}', SELL, 10, MID_PRICE + 1 + i)
+    return book
+
+
+def run(depth, num_orders, rng):
+    book = build_book(depth)
+    # 预先生成订单流：约25%吃单、60%挂单、15%撤单，使订单簿深度大致保持
+    flow = []
+    for _ in range(num_orders):
+        side = BUY if rng.random() < 0.5 else SELL
+        kind = rng.random()
+        offset = rng.randint(1, depth)
+        if kind < 0.25:
+            price = MID_PRICE + offset if side == BUY else MID_PRICE - offset
+        else:
+            price = MID_PRICE - offset if side == BUY else MID_PRICE + offset
+        flow.append((kind >= 0.85, side, rng.randint(1, 10), price))
+
+    start = time.perf_counter()
+    fills = 0
+    for i, (is_cancel, side, qty, price) in enumerate(flow):
+        if is_cancel and book.orders:
+            book.cancel(next(iter(book.orders)))
+        else:
+            result, _, _ = book.submit_limit(f'taker{i % 50}', side, qty, price)
+            fills += len(result)
+    elapsed = time.perf_counter() - start
+    return num_orders / elapsed, fills, len(book)
+
+
+def main():
+    num_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rng = random.Random(42)
+    print(f'订单数: {num_orders}，每档初始挂单: {ORDERS_PER_LEVEL}')
+    print(f'{"档位深度":>8} {"订单/秒":>12} {"成交笔数":>10} {"剩余挂单":>10}')
+    for depth in DEPTHS:
+        rate, fills, resting = run(depth, num_orders, rng)
+        print(f'{depth:>8} {rate:>12,.0f} {fills:>10} {resting:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按需启动的采样分析器
+在后台线程中定期读取其他线程的调用栈，输出 collapsed-stack（火焰图）格式和热点函数汇总
+不依赖 Flask，可在游戏进行中开启
+"""
+
+import linecache
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+DEFAULT_INTERVAL = 0.01  # 最短采样间隔（秒）
+OVERHEAD_BUDGET = 0.02  # 采样耗时占比上限，超出时自动拉长采样间隔
+MAX_DURATION = 120  # 单次采样最长时间（秒）
+
+# 栈顶处于这些函数或调用时视为线程空闲（等待锁、I/O 或 sleep），不计入采样
+IDLE_FUNCTIONS = {'wait', 'select', 'poll', 'recv', 'recv_into', 'readinto', 'accept',
+                  '_wait_for_tstate_lock', 'serve_forever'}
+IDLE_CALLS = ('sleep(', '.wait(', '.acquire(', 'select(', '.poll(', '.recv', '.accept(')
+
+
+def _frame_label(code):
+    # 按函数定义行聚合；collapsed-stack 格式用 ';' 分隔栈帧，因此不能出现在标签中
+    label = f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+    return label.replace(';', ':')
+
+
+def _is_idle_line(code, lineno):
+    if code.co_name in IDLE_FUNCTIONS:
+        return True
+    line = linecache.getline(code.co_filename, lineno)
+    return any(call in line for call in IDLE_CALLS)
+
+
+class SamplingProfiler:
+    """采样分析器：sys._current_frames() 读取各线程的栈，统计各调用栈出现次数。
+
+    只展开正在运行的线程：栈顶在等待锁、I/O 或 sleep 的线程只做一次字典查找就跳过。
+    栈帧标签和空闲判断按代码对象缓存；单次采样耗时超出 OVERHEAD_BUDGET 时自动拉长间隔。
+    """
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stacks = Counter()  # {'线程名;外层函数;...;内层函数': 次数}
+        self.samples = 0
+        self.idle_skipped = 0  # 因空闲而跳过的线程栈数
+        self.sampling_time = 0.0  # 采样本身耗费的CPU时间，用于估算开销
+        self.labels = {}  # {code: 标签}
+        self.idle_lines = {}  # {(code, lineno): 是否空闲}
+        self.thread_names = {}  # {ident: 线程名}
+        self.thread_count = 0  # 上次枚举时的线程数
+        self.started_at = None
+        self.duration = 0
+        self.elapsed = 0.0
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, duration):
+        duration = max(1, min(int(duration), MAX_DURATION))
+        with self.lock:
+            if self.is_running():
+                return False
+            self.stacks = Counter()
+            self.samples = 0
+            self.idle_skipped = 0
+            self.sampling_time = 0.0
+            self.thread_names = {}  # 线程ident会被复用，每次采样重新建立
+            self.thread_count = 0
+            self.started_at = time.time()
+            self.duration = duration
+            self.elapsed = 0.0
+            self.thread = threading.Thread(target=self._run, args=(duration,),
+                                           name='sampling-profiler', daemon=True)
+            self.thread.start()
+        return True
+
+    def _refresh_thread_names(self):
+        self.thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        self.thread_count = threading.active_count()
+
+    def _thread_name(self, ident):
+        name = self.thread_names.get(ident)
+        if name is None:
+            # 出现未知ident时重新枚举
+            self._refresh_thread_names()
+            name = self.thread_names.get(ident, f'thread-{ident}')
+        return name
+
+    def _sample(self, own_ident):
+        labels_cache = self.labels
+        idle_lines = self.idle_lines
+        stacks = []
+        idle = 0
+        # 线程数变化说明有线程启动或退出，其ident可能被新线程复用
+        if threading.active_count() != self.thread_count:
+            self._refresh_thread_names()
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            code = frame.f_code
+            leaf = (code, frame.f_lineno)
+            is_idle = idle_lines.get(leaf)
+            if is_idle is None:
+                is_idle = idle_lines[leaf] = _is_idle_line(code, frame.f_lineno)
+            if is_idle:
+                idle += 1
+                continue
+            labels = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels_cache.get(code)
+                if label is None:
+                    label = labels_cache[code] = _frame_label(code)
+                labels.append(label)
+                frame = frame.f_back
+            labels.append(self._thread_name(ident))
+            labels.reverse()
+            stacks.append(';'.join(labels))
+        return stacks, idle
+
+    def _run(self, duration):
+        own_ident = threading.get_ident()
+        start = time.perf_counter()
+        deadline = start + duration
+        avg_cost = 0.0
+        while time.perf_counter() < deadline:
+            # 用本线程CPU时间计算开销，排除等待GIL的时间
+            sample_start = time.thread_time()
+            stacks, idle = self._sample(own_ident)
+            cost = time.thread_time() - sample_start
+            with self.lock:
+                self.stacks.update(stacks)
+                self.samples += 1
+                self.idle_skipped += idle
+                self.sampling_time += cost
+            # 按平均采样耗时调整间隔，使开销不超过 OVERHEAD_BUDGET
+            avg_cost = cost if self.samples == 1 else avg_cost * 0.8 + cost * 0.2
+            time.sleep(max(self.interval, avg_cost / OVERHEAD_BUDGET))
+        with self.lock:
+            self.elapsed = time.perf_counter() - start
+
+    def collapsed(self):
+        """collapsed-stack 格式（flamegraph.pl / speedscope 可直接读取）。"""
+        with self.lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def summary(self, limit=30):
+        """热点函数汇总：self 为位于栈顶的次数，total 为出现在栈中的次数。"""
+        with self.lock:
+            stacks = list(self.stacks.items())
+            samples = self.samples
+            sampling_time = self.sampling_time
+            idle_skipped = self.idle_skipped
+            elapsed = self.elapsed or (time.time() - self.started_at if self.started_at else 0)
+            running = self.is_running()
+
+        self_counts = Counter()
+        total_counts = Counter()
+        total_frames = 0
+        for stack, count in stacks:
+            frames = stack.split(';')[1:]  # 第一个是线程名
+            if not frames:
+                continue
+            total_frames += count
+            self_counts[frames[-1]] += count
+            for label in set(frames):
+                total_counts[label] += count
+
+        overhead = (sampling_time / elapsed * 100) if elapsed else 0
+        avg_interval = (elapsed / samples * 1000) if samples else 0
+        lines = [
+            f'状态: {"采样中" if running else "已完成"}',
+            f'采样时长: {elapsed:.1f}秒，采样次数: {samples}，平均间隔: {avg_interval:.0f}毫秒',
+            f'采样开销: {sampling_time:.3f}秒（约 {overhead:.2f}%），跳过空闲线程栈: {idle_skipped}',
+            '',
+            f'{"self%":>7} {"total%":>7} {"self":>7} {"total":>7}  函数'
+        ]
+        for label, total in total_counts.most_common(limit):
+            self_count = self_counts.get(label, 0)
+            lines.append(f'{self_count / total_frames * 100:>6.1f}% {total / total_frames * 100:>6.1f}% '
+                         f'{self_count:>7} {total:>7}  {label}')
+        return '\n'.join(lines) + '\n'
@@ -13,6 +13,9 @@ import threading
 import time
 from datetime import datetime
 import json
+from leaderboard import Leaderboard
+from order_book import OrderBook, BUY, SELL
+from sampling_profiler import SamplingProfiler
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'trading-platform-secret-key'
@@ -27,6 +30,10 @@ TOTAL_SECONDS = 280
 QUIET_PERIOD_START = 270
 LOSS_LIMIT = 500
 ADMIN_PASSWORD = 'admin123'  # 管理员密码，可以修改
+LEADERBOARD_TOP_K = 10  # 广播给所有用户的排行榜条数
+LIMIT_ORDER_MODE = False  # 限价单模式：允许用户挂单，市价单和机器人订单流先与挂单成交
+ORDER_BOOK_DEPTH = 5  # 广播的订单簿档位数
+PROFILER_DEFAULT_SECONDS = 10  # 管理员启动采样分析的默认时长（秒）
 
 # --- 全局状态 ---
 class GameState:
@@ -51,6 +58,8 @@ class GameState:
         self.cur_sec_sell = 0
         self.tick_thread = None
         self.lock = threading.Lock()
+        self.leaderboard = Leaderboard()  # 按总权益排名（不含管理员）
+        self.order_book = OrderBook()  # 限价单模式下的用户挂单
         
         # 初始化历史数据点
         self.history.append({
@@ -63,6 +72,7 @@ class GameState:
         })
 
 game_state = GameState()
+profiler = SamplingProfiler()  # 管理员按需启动的采样分析器
 
 # --- 计算总用户需求 ---
 def get_total_user_demand():
@@ -76,6 +86,44 @@ def update_market_price():
     total_demand = game_state.robot_demand + get_total_user_demand()
     offset = int(LAMBDA * total_demand)
     game_state.market_price = 500 + offset
+    # 价格变化会改变所有持仓用户的权益，需要重排
+    if game_state.leaderboard.price != game_state.market_price:
+        reprice_leaderboard()
+
+# --- 排行榜维护 ---
+def rebuild_leaderboard():
+    game_state.leaderboard.rebuild(game_state.users, game_state.market_price,
+                                   excluded=game_state.admins)
+
+def reprice_leaderboard():
+    if game_state.leaderboard.price is None:
+        rebuild_leaderboard()
+    else:
+        game_state.leaderboard.reprice(game_state.users, game_state.market_price)
+
+def update_leaderboard(user_id):
+    if user_id in game_state.admins or user_id not in game_state.users:
+        return
+    if game_state.leaderboard.price != game_state.market_price:
+        reprice_leaderboard()
+    game_state.leaderboard.update(user_id, game_state.users[user_id], game_state.market_price)
+
+def get_leaderboard_index(user_id):
+    position = game_state.leaderboard.position(user_id)
+    if position is None or position >= LEADERBOARD_TOP_K:
+        return None
+    return position
+
+def get_leaderboard_entries(k=None):
+    entries = []
+    for rank, user_id, total_equity in game_state.leaderboard.top(k):
+        user_data = game_state.users.get(user_id, {})
+        entries.append({
+            'rank': rank,
+            'name': user_data.get('name', f'用户{user_id[:8]}'),
+            'total_equity': total_equity
+        })
+    return entries
 
 # --- 计算未实现盈亏 ---
 def calculate_unrealized_pl(user_data):
@@ -92,6 +140,7 @@ def check_risk(user_id, user_data):
         # 强制平仓
         demand = user_data.get('demand', 0)
         if demand != 0:
+            game_state.order_book.cancel_owner(user_id)  # 撤销该用户所有挂单
             close_qty = -demand
             close_price = (game_state.market_price + 1) if close_qty > 0 else (game_state.market_price - 1)
             
@@ -110,9 +159,132 @@ def check_risk(user_id, user_data):
                 game_state.cur_sec_sell += abs_close
             
             update_market_price()
+            update_leaderboard(user_id)
             return True
     return False
 
+# --- 成交记账 ---
+def add_market_volume(is_buy, qty):
+    if is_buy:
+        game_state.market_buys += qty
+        game_state.cur_sec_buy += qty
+    else:
+        game_state.market_sells += qty
+        game_state.cur_sec_sell += qty
+
+def execute_user_fill(user_id, qty, exec_price):
+    # qty为带符号数量（正数买入，负数卖出），不含市场成交统计
+    user_data = game_state.users.get(user_id)
+    if user_data is None:
+        return
+    if 'trade_history' not in user_data:
+        user_data['trade_history'] = []
+    
+    is_buy = qty > 0
+    abs_qty = abs(qty)
+    
+    # 记录交易历史
+    trade_record = {
+        'time': game_state.time_elapsed,  # 游戏内时间（秒）
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),  # 实际时间戳
+        'action': 'BUY' if is_buy else 'SELL',
+        'quantity': abs_qty,
+        'price': exec_price,
+        'market_price': game_state.market_price,
+        'demand_before': user_data['demand'],
+        'demand_after': user_data['demand'] + qty
+    }
+    user_data['trade_history'].append(trade_record)
+    
+    # 更新交易统计
+    if is_buy:
+        user_data['buys'] += abs_qty
+    else:
+        user_data['sells'] += abs_qty
+    
+    # 更新持仓
+    old_pos = user_data['demand']
+    new_pos = old_pos + qty
+    
+    user_data['cash'] -= (qty * exec_price)
+    
+    # 更新平均价格
+    if old_pos == 0:
+        user_data['avg_price'] = exec_price
+    elif (old_pos > 0 and qty > 0) or (old_pos < 0 and qty < 0):
+        old_val = abs(old_pos) * user_data['avg_price']
+        new_val = abs_qty * exec_price
+        user_data['avg_price'] = (old_val + new_val) / abs(new_pos)
+    else:
+        if (new_pos > 0 and old_pos < 0) or (new_pos < 0 and old_pos > 0):
+            user_data['avg_price'] = exec_price
+        elif new_pos == 0:
+            user_data['avg_price'] = 0
+    
+    user_data['demand'] = new_pos
+
+# --- 订单簿成交 ---
+def settle_book_fills(fills, taker_id=None):
+    # 把订单簿成交记入挂单方（及用户吃单方）账户，返回成交的挂单用户
+    makers = set()
+    for fill in fills:
+        maker_qty = fill.qty if fill.side == BUY else -fill.qty
+        execute_user_fill(fill.owner, maker_qty, fill.price)
+        if taker_id is not None:
+            execute_user_fill(taker_id, -maker_qty, fill.price)
+        makers.add(fill.owner)
+    return makers
+
+def notify_self_trade_cancels(cancelled):
+    # 进入订单与自己的挂单相遇时，旧挂单被撤销，需要通知本人
+    for order in cancelled:
+        socketio.emit('order_cancelled', {
+            'order_id': order.order_id,
+            'reason': 'self_trade'
+        }, room=order.owner)
+
+def check_makers_risk(makers):
+    # 挂单被动成交后同样可能超过亏损限制，需立即检查
+    for maker_id in makers:
+        maker_data = game_state.users.get(maker_id)
+        if maker_data is not None and check_risk(maker_id, maker_data):
+            socketio.emit('risk_liquidated', {'user_id': maker_id}, room=maker_id)
+
+def match_robot_flow(robot_trade):
+    # 机器人订单流先与不劣于做市商报价的挂单成交（机器人成交量已计入市场统计）
+    book = game_state.order_book
+    makers = set()
+    if robot_trade != 0:
+        is_buy = robot_trade > 0
+        mm_price = (game_state.market_price + 1) if is_buy else (game_state.market_price - 1)
+        fills, _, _ = book.match(BUY if is_buy else SELL, int(abs(robot_trade)), mm_price)
+        makers |= settle_book_fills(fills)
+    
+    # 价格变动后与做市商报价交叉的挂单，由做市商按挂单价格成交
+    for side, mm_price in ((SELL, game_state.market_price + 1), (BUY, game_state.market_price - 1)):
+        fills, _, _ = book.match(side, float('inf'), mm_price)
+        for fill in fills:
+            add_market_volume(fill.side == BUY, fill.qty)
+        makers |= settle_book_fills(fills)
+    
+    if makers:
+        update_market_price()
+        for user_id in makers:
+            update_leaderboard(user_id)
+
+def get_quotes():
+    # 做市商报价为市场价格±1，限价单模式下取订单簿中更优的价格
+    bid = game_state.market_price - 1
+    ask = game_state.market_price + 1
+    if LIMIT_ORDER_MODE:
+        best_bid = game_state.order_book.best_bid()
+        best_ask = game_state.order_book.best_ask()
+        if best_bid is not None and best_bid > bid:
+            bid = best_bid
+        if best_ask is not None and best_ask < ask:
+            ask = best_ask
+    return bid, ask
+
 # --- 游戏循环 ---
 def game_tick():
     # 主循环：等待管理员操作
@@ -177,6 +349,8 @@ def game_tick():
                 
                 # 3. 更新市场价格
                 update_market_price()
+                if LIMIT_ORDER_MODE:
+                    match_robot_flow(robot_trade)
                 
                 # 4. 检查所有用户的风险
                 for user_id, user_data in list(game_state.users.items()):
@@ -184,13 +358,14 @@ def game_tick():
                         socketio.emit('risk_liquidated', {'user_id': user_id}, room='game')
                 
                 # 5. 记录历史（限制历史数据大小，避免内存溢出）
+                bid, ask = get_quotes()
                 game_state.history.append({
                     't': game_state.time_elapsed,
                     'p': game_state.market_price,
                     'volBuy': game_state.cur_sec_buy,
                     'volSell': game_state.cur_sec_sell,
-                    'b': game_state.market_price - 1,
-                    'a': game_state.market_price + 1
+                    'b': bid,
+                    'a': ask
                 })
                 
                 # 限制历史数据大小（保留最近500个点）
@@ -214,6 +389,7 @@ def game_tick():
         if game_state.time_left <= 0:
             with game_state.lock:
                 game_state.is_running = False
+                game_state.order_book.clear()  # 游戏结束，撤销所有挂单
                 print(f'游戏结束！总时长: {game_state.time_elapsed}秒')
                 # 计算最终财富
                 final_results = {}
@@ -253,11 +429,16 @@ def broadcast_state():
         'total_user_sells': total_user_sells,
         'total_user_net': total_user_net,
         'history': list(game_state.history[-100:]) if len(game_state.history) > 0 else [],  # 发送最近100个数据点，确保转换为列表
-        'users': {}
+        'leaderboard': get_leaderboard_entries(LEADERBOARD_TOP_K),  # 只发送前K名
+        'tied_at_cutoff': game_state.leaderboard.tied_at_cutoff(LEADERBOARD_TOP_K),  # 与第K名并列但未列出的人数
+        'limit_order_mode': LIMIT_ORDER_MODE
     }
+    if LIMIT_ORDER_MODE:
+        state['order_book'] = game_state.order_book.depth(ORDER_BOOK_DEPTH)
     
-    # 添加每个用户的详细信息（仅用于当前用户自己的数据）
+    # 每个用户自己的详细数据（单独发送，不进入公共状态）
     online_users = []
+    user_infos = {}
     for user_id, user_data in game_state.users.items():
         # 排除管理员，只统计普通用户
         if user_data.get('connected', False) and user_id not in game_state.admins:
@@ -267,38 +448,44 @@ def broadcast_state():
                 'name': user_data.get('name', f'用户{user_id[:8]}')
             })
             
-            # 只向对应用户发送其自己的详细交易数据（排除管理员）
-            if user_id not in game_state.admins:
-                demand = user_data.get('demand', 0)
-                avg_price = user_data.get('avg_price', 0)
-                unrealized = calculate_unrealized_pl(user_data)
-                total_equity = user_data.get('cash', 0) + (demand * game_state.market_price)
-                realized = total_equity - unrealized
-                
-                user_info = {
-                    'id': user_id,
-                    'name': user_data.get('name', f'用户{user_id[:8]}'),
-                    'demand': demand,
-                    'buys': user_data.get('buys', 0),
-                    'sells': user_data.get('sells', 0),
-                    'net': user_data.get('buys', 0) - user_data.get('sells', 0),
-                    'avg_price': avg_price,
-                    'realized': realized,
-                    'unrealized': unrealized,
-                    'exposure': demand,
-                    'total_equity': total_equity
-                }
-                state['users'][user_id] = user_info
+            demand = user_data.get('demand', 0)
+            avg_price = user_data.get('avg_price', 0)
+            unrealized = calculate_unrealized_pl(user_data)
+            total_equity = user_data.get('cash', 0) + (demand * game_state.market_price)
+            realized = total_equity - unrealized
+            
+            user_infos[user_id] = {
+                'id': user_id,
+                'name': user_data.get('name', f'用户{user_id[:8]}'),
+                'demand': demand,
+                'buys': user_data.get('buys', 0),
+                'sells': user_data.get('sells', 0),
+                'net': user_data.get('buys', 0) - user_data.get('sells', 0),
+                'avg_price': avg_price,
+                'realized': realized,
+                'unrealized': unrealized,
+                'exposure': demand,
+                'total_equity': total_equity,
+                'rank': game_state.leaderboard.rank(user_id),
+                'leaderboard_index': get_leaderboard_index(user_id)  # 在前K名列表中的位置，不在其中为None
+            }
+            if LIMIT_ORDER_MODE:
+                user_infos[user_id]['open_orders'] = game_state.order_book.get_owner_orders(user_id)
     
     # 添加在线用户统计（只发送用户昵称，不包含交易信息）
     state['online_count'] = len(online_users)
     state['online_users'] = online_users  # 只包含ID和昵称
+    state['ranked_count'] = len(game_state.leaderboard)
     
-    # 使用压缩发送以减少网络传输
+    # 公共状态只广播一次（使用压缩发送以减少网络传输）
     try:
         socketio.emit('state_update', state, room='game', compress=True)
     except:
         socketio.emit('state_update', state, room='game')
+    
+    # 再向每个用户单独发送自己的数据（含排名）
+    for user_id, user_info in user_infos.items():
+        socketio.emit('user_state', user_info, room=user_id)
 
 # --- WebSocket 事件处理 ---
 @socketio.on('connect')
@@ -323,10 +510,11 @@ def handle_connect():
             }
         else:
             game_state.users[user_id]['connected'] = True
+        update_leaderboard(user_id)
         
         # 如果游戏还没开始，启动倒计时和游戏循环
         if not game_state.is_running and not game_state.is_countdown and game_state.tick_thread is None:
-            game_state.tick_thread = threading.Thread(target=game_tick, daemon=True)
+            game_state.tick_thread = threading.Thread(target=game_tick, name='game-tick', daemon=True)
             game_state.tick_thread.start()
         
         # 发送完整状态
@@ -341,6 +529,8 @@ def handle_disconnect():
     with game_state.lock:
         if user_id in game_state.users:
             game_state.users[user_id]['connected'] = False
+        # 离线用户的挂单无人管理，全部撤销
+        game_state.order_book.cancel_owner(user_id)
         # 更新市场价格（移除该用户的需求）
         update_market_price()
         broadcast_state()
@@ -373,6 +563,7 @@ def handle_set_username(data):
             game_state.users[user_id]['name'] = username
             if 'trade_history' not in game_state.users[user_id]:
                 game_state.users[user_id]['trade_history'] = []
+        update_leaderboard(user_id)
         
         emit('username_set', {'name': username})
         broadcast_state()
@@ -383,7 +574,9 @@ def handle_admin_login(data):
     password = data.get('password', '')
     
     if password == ADMIN_PASSWORD:
-        game_state.admins.add(user_id)
+        with game_state.lock:
+            game_state.admins.add(user_id)
+            game_state.leaderboard.remove(user_id)  # 管理员不参与排名
         emit('admin_login_success', {'message': '管理员登录成功'})
         print(f'管理员登录: {user_id}')
         broadcast_state()
@@ -450,6 +643,8 @@ def handle_admin_reset_game():
             user_data['avg_price'] = 0
             user_data['buys'] = 0
             user_data['sells'] = 0
+        rebuild_leaderboard()
+        game_state.order_book.clear()
         
         game_state.game_start_time = None
         print(f'管理员 {user_id} 重置游戏')
@@ -506,6 +701,75 @@ def handle_admin_export_data():
         
         emit('admin_export_data', export_data)
 
+@socketio.on('admin_get_leaderboard')
+def handle_admin_get_leaderboard():
+    user_id = request.sid
+    
+    if user_id not in game_state.admins:
+        emit('error', {'message': '无管理员权限'})
+        return
+    
+    with game_state.lock:
+        # 完整排名（按当前市场价格计算的总权益）
+        ranking = []
+        for rank, user_id_key, total_equity in game_state.leaderboard.top():
+            user_data = game_state.users.get(user_id_key, {})
+            ranking.append({
+                'rank': rank,
+                'user_id': user_id_key[:8],  # 只显示前8位
+                'name': user_data.get('name', f'用户{user_id_key[:8]}'),
+                'demand': user_data.get('demand', 0),
+                'cash': user_data.get('cash', 0),
+                'total_equity': total_equity,
+                'connected': user_data.get('connected', False)
+            })
+        
+        emit('admin_leaderboard', {
+            'market_price': game_state.market_price,
+            'ranking': ranking
+        })
+
+@socketio.on('admin_start_profiler')
+def handle_admin_start_profiler(data=None):
+    user_id = request.sid
+    
+    if user_id not in game_state.admins:
+        emit('error', {'message': '无管理员权限'})
+        return
+    
+    data = data or {}
+    try:
+        seconds = int(data.get('seconds', PROFILER_DEFAULT_SECONDS))
+    except (TypeError, ValueError):
+        seconds = PROFILER_DEFAULT_SECONDS
+    
+    # 采样在独立线程中进行，不持有game_state.lock
+    if not profiler.start(seconds):
+        emit('error', {'message': '采样分析已在进行中'})
+        return
+    
+    print(f'管理员 {user_id} 启动采样分析: {profiler.duration}秒')
+    emit('admin_profiler_started', {'seconds': profiler.duration})
+
+@socketio.on('admin_get_profile')
+def handle_admin_get_profile(data=None):
+    user_id = request.sid
+    
+    if user_id not in game_state.admins:
+        emit('error', {'message': '无管理员权限'})
+        return
+    
+    kind = (data or {}).get('kind', 'summary')
+    if kind == 'collapsed':
+        content, filename = profiler.collapsed(), 'profile_collapsed.txt'
+    elif kind == 'summary':
+        content, filename = profiler.summary(), 'profile_summary.txt'
+    else:
+        emit('error', {'message': '未知的分析结果类型'})
+        return
+    
+    emit('admin_profile', {'kind': kind, 'filename': filename, 'content': content})
+
 @socketio.on('user_trade')
 def handle_trade(data):
     user_id = request.sid
@@ -541,58 +805,122 @@ def handle_trade(data):
         
         exec_price = (game_state.market_price + 1) if is_buy else (game_state.market_price - 1)
         
-        # 记录交易历史
-        trade_record = {
-            'time': game_state.time_elapsed,  # 游戏内时间（秒）
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),  # 实际时间戳
-            'action': 'BUY' if is_buy else 'SELL',
-            'quantity': abs_qty,
-            'price': exec_price,
-            'market_price': game_state.market_price,
-            'demand_before': user_data['demand'],
-            'demand_after': user_data['demand'] + qty
-        }
-        user_data['trade_history'].append(trade_record)
+        # 更新市场成交统计
+        add_market_volume(is_buy, abs_qty)
         
-        # 更新交易统计
-        if is_buy:
-            user_data['buys'] += abs_qty
-            game_state.market_buys += abs_qty
-            game_state.cur_sec_buy += abs_qty
-        else:
-            user_data['sells'] += abs_qty
-            game_state.market_sells += abs_qty
-            game_state.cur_sec_sell += abs_qty
+        # 限价单模式下先与不劣于做市商报价的挂单成交，剩余部分由做市商成交
+        remaining = abs_qty
+        makers = set()
+        if LIMIT_ORDER_MODE:
+            fills, remaining, cancelled = game_state.order_book.match(BUY if is_buy else SELL, abs_qty, exec_price, user_id)
+            makers = settle_book_fills(fills, user_id)
+            notify_self_trade_cancels(cancelled)
+        if remaining > 0:
+            execute_user_fill(user_id, remaining if is_buy else -remaining, exec_price)
         
-        # 更新持仓
-        old_pos = user_data['demand']
-        new_pos = old_pos + qty
+        # 更新市场价格和排名
+        update_market_price()
+        update_leaderboard(user_id)
+        for maker_id in makers:
+            update_leaderboard(maker_id)
         
-        user_data['cash'] -= (qty * exec_price)
+        # 检查风险
+        if check_risk(user_id, user_data):
+            emit('risk_liquidated', {'user_id': user_id})
+        check_makers_risk(makers)
         
-        # 更新平均价格
-        if old_pos == 0:
-            user_data['avg_price'] = exec_price
-        elif (old_pos > 0 and qty > 0) or (old_pos < 0 and qty < 0):
-            old_val = abs(old_pos) * user_data['avg_price']
-            new_val = abs_qty * exec_price
-            user_data['avg_price'] = (old_val + new_val) / abs(new_pos)
-        else:
-            if (new_pos > 0 and old_pos < 0) or (new_pos < 0 and old_pos > 0):
-                user_data['avg_price'] = exec_price
-            elif new_pos == 0:
-                user_data['avg_price'] = 0
+        # 广播更新
+        broadcast_state()
+
+@socketio.on('user_limit_order')
+def handle_limit_order(data):
+    user_id = request.sid
+    
+    if not LIMIT_ORDER_MODE:
+        emit('error', {'message': '限价单模式未开启'})
+        return
+    
+    if not game_state.is_running or game_state.is_countdown:
+        emit('error', {'message': '游戏未开始，请等待管理员启动'})
+        return
+    
+    try:
+        qty = int(data.get('qty', 0))
+        price = int(data.get('price', 0))
+    except (TypeError, ValueError):
+        emit('error', {'message': '订单参数无效'})
+        return
+    
+    if qty == 0 or price <= 0:
+        emit('error', {'message': '订单参数无效'})
+        return
+    
+    with game_state.lock:
+        if user_id not in game_state.users or user_id in game_state.admins:
+            emit('error', {'message': '用户不存在'})
+            return
+        
+        user_data = game_state.users[user_id]
+        is_buy = qty > 0
+        side = BUY if is_buy else SELL
+        abs_qty = abs(qty)
+        book = game_state.order_book
+        mm_price = (game_state.market_price + 1) if is_buy else (game_state.market_price - 1)
+        
+        # 1. 与订单簿中价格优于（或等于）做市商报价的挂单成交
+        match_limit = min(price, mm_price) if is_buy else max(price, mm_price)
+        fills, remaining, cancelled = book.match(side, abs_qty, match_limit, user_id)
+        makers = settle_book_fills(fills, user_id)
+        notify_self_trade_cancels(cancelled)
         
-        user_data['demand'] = new_pos
+        # 2. 可与做市商成交的剩余部分按做市商报价成交，否则挂入订单簿
+        marketable = price >= mm_price if is_buy else price <= mm_price
+        order = None
+        if remaining > 0 and marketable:
+            execute_user_fill(user_id, remaining if is_buy else -remaining, mm_price)
+        elif remaining > 0:
+            fills, order, cancelled = book.submit_limit(user_id, side, remaining, price, game_state.time_elapsed)
+            makers |= settle_book_fills(fills, user_id)
+            notify_self_trade_cancels(cancelled)
+        
+        filled = abs_qty - (order.qty if order else 0)
+        if filled > 0:
+            add_market_volume(is_buy, filled)
         
-        # 更新市场价格
         update_market_price()
+        update_leaderboard(user_id)
+        for maker_id in makers:
+            update_leaderboard(maker_id)
+        
+        emit('order_accepted', {
+            'order': order.to_dict() if order else None,
+            'filled': filled
+        })
         
-        # 检查风险
         if check_risk(user_id, user_data):
             emit('risk_liquidated', {'user_id': user_id})
+        check_makers_risk(makers)
         
-        # 广播更新
+        broadcast_state()
+
+@socketio.on('user_cancel_order')
+def handle_cancel_order(data):
+    user_id = request.sid
+    
+    try:
+        order_id = int(data.get('order_id', 0))
+    except (TypeError, ValueError):
+        emit('error', {'message': '订单不存在'})
+        return
+    
+    with game_state.lock:
+        order = game_state.order_book.orders.get(order_id)
+        if order is None or order.owner != user_id:
+            emit('error', {'message': '订单不存在'})
+            return
+        
+        game_state.order_book.cancel(order_id)
+        emit('order_cancelled', {'order_id': order_id})
         broadcast_state()
 
 # --- 静态文件服务 ---
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+排行榜单元测试
+运行: python -m unittest test_leaderboard
+"""
+
+import random
+import unittest
+
+from leaderboard import Leaderboard
+
+
+def user(cash, demand=0):
+    return {'cash': cash, 'demand': demand}
+
+
+class LeaderboardTest(unittest.TestCase):
+    def assertConsistent(self, board):
+        self.assertEqual(board.keys, sorted(board.keys))
+        self.assertEqual(sorted(board.keys), sorted(board.entries.values()))
+        self.assertEqual(sum(board.equity_counts.values()), len(board.keys))
+        for user_id, key in board.entries.items():
+            self.assertEqual(key[1], user_id)
+
+    def test_tied_equity_shares_rank(self):
+        board = Leaderboard()
+        board.rebuild({'a': user(10), 'b': user(10), 'c': user(5), 'd': user(0)}, 500)
+        self.assertEqual([board.rank(user_id) for user_id in 'abcd'], [1, 1, 3, 4])
+        self.assertEqual([rank for rank, _, _ in board.top()], [1, 1, 3, 4])
+        self.assertIsNone(board.rank('x'))
+
+    def test_top_is_capped_at_k_with_tie_count(self):
+        board = Leaderboard()
+        users = {str(i): user(0) for i in range(59)}
+        users['trader'] = user(50)
+        board.rebuild(users, 500)
+        top = board.top(10)
+        self.assertEqual(len(top), 10)
+        self.assertEqual(top[0][:2], (1, 'trader'))
+        self.assertEqual([rank for rank, _, _ in top[1:]], [2] * 9)
+        self.assertEqual(board.tied_at_cutoff(10), 50)
+        self.assertEqual(board.tied_at_cutoff(1), 0)
+        self.assertEqual(board.tied_at_cutoff(100), 0)
+        self.assertEqual([board.position(user_id) for _, user_id, _ in top], list(range(10)))
+        self.assertIsNone(board.position('missing'))
+        board.update('3', user(20), 500)
+        board.remove('4')
+        # 57人权益为0，前10名中列出8人
+        self.assertEqual(board.tied_at_cutoff(10), 49)
+
+    def test_update_and_remove_keep_keys_and_entries_in_step(self):
+        board = Leaderboard()
+        users = {str(i): user(i * 10) for i in range(20)}
+        board.rebuild(users, 500, excluded={'0'})
+        self.assertNotIn('0', board.entries)
+        board.update('5', user(1000), 500)
+        self.assertEqual(board.rank('5'), 1)
+        board.update('new', user(-1), 500)
+        board.remove('7')
+        board.remove('missing')
+        self.assertConsistent(board)
+        self.assertEqual(len(board), 19)
+        self.assertIsNone(board.rank('7'))
+        self.assertEqual(board.rank('new'), 19)
+
+    def test_reprice_reorders_by_new_equity(self):
+        board = Leaderboard()
+        users = {'long': user(-5000, 10), 'flat': user(100), 'short': user(5200, -10)}
+        board.rebuild(users, 500)
+        self.assertEqual([user_id for _, user_id, _ in board.top()], ['short', 'flat', 'long'])
+        board.reprice(users, 530)
+        self.assertEqual(board.price, 530)
+        self.assertEqual([user_id for _, user_id, _ in board.top()], ['long', 'flat', 'short'])
+        self.assertConsistent(board)
+
+    def test_reprice_matches_rebuild(self):
+        rng = random.Random(7)
+        users = {str(i): user(rng.randint(-1000, 1000), rng.randint(-20, 20)) for i in range(200)}
+        board = Leaderboard()
+        board.rebuild(users, 500)
+        board.reprice(users, 503)
+        expected = Leaderboard()
+        expected.rebuild(users, 503)
+        self.assertEqual(board.keys, expected.keys)
+        self.assertEqual(board.entries, expected.entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
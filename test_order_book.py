@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+订单簿单元测试
+运行: python -m unittest test_order_book
+"""
+
+import unittest
+
+from order_book import OrderBook, BUY, SELL
+
+
+class OrderBookTest(unittest.TestCase):
+    def test_place_cancel_replace_does_not_grow_heap(self):
+        book = OrderBook()
+        book.submit_limit('a', BUY, 1, 500)
+        book.submit_limit('a', SELL, 1, 510)
+        # 反复在次优档位挂单、撤单
+        for _ in range(1000):
+            _, bid, _ = book.submit_limit('b', BUY, 1, 499)
+            _, ask, _ = book.submit_limit('b', SELL, 1, 511)
+            book.cancel(bid.order_id)
+            book.cancel(ask.order_id)
+        self.assertEqual(len(book.bid_prices), 2)
+        self.assertEqual(len(book.ask_prices), 2)
+        self.assertEqual(book.best_bid(), 500)
+        self.assertEqual(book.best_ask(), 510)
+
+    def test_cancel_best_level_then_replace(self):
+        book = OrderBook()
+        book.submit_limit('a', BUY, 1, 499)
+        _, order, _ = book.submit_limit('a', BUY, 2, 500)
+        book.cancel(order.order_id)
+        self.assertEqual(book.best_bid(), 499)
+        book.submit_limit('a', BUY, 3, 500)
+        self.assertEqual(book.best_bid(), 500)
+        self.assertEqual(book.depth(), {'bids': [[500, 3], [499, 1]], 'asks': []})
+
+    def test_self_trade_cancels_own_resting_order(self):
+        book = OrderBook()
+        _, own, _ = book.submit_limit('a', SELL, 2, 501)
+        book.submit_limit('b', SELL, 2, 502)
+        fills, remaining, cancelled = book.match(BUY, 3, None, 'a')
+        self.assertEqual([order.order_id for order in cancelled], [own.order_id])
+        self.assertEqual([(fill.owner, fill.qty) for fill in fills], [('b', 2)])
+        self.assertEqual(remaining, 1)
+        self.assertNotIn(own.order_id, book.orders)
+
+
+    def test_fifo_priority_within_level(self):
+        book = OrderBook()
+        _, first, _ = book.submit_limit('a', SELL, 2, 501)
+        _, second, _ = book.submit_limit('b', SELL, 2, 501)
+        _, third, _ = book.submit_limit('c', SELL, 2, 501)
+        fills, remaining, _ = book.match(BUY, 3, None, 'taker')
+        self.assertEqual([(fill.order_id, fill.qty) for fill in fills],
+                         [(first.order_id, 2), (second.order_id, 1)])
+        self.assertEqual(remaining, 0)
+        self.assertEqual(list(book.asks[501].orders), [second.order_id, third.order_id])
+
+    def test_partial_fill_updates_maker_and_level_qty(self):
+        book = OrderBook()
+        _, maker, _ = book.submit_limit('a', BUY, 10, 499)
+        book.submit_limit('b', BUY, 5, 499)
+        fills, remaining, _ = book.match(SELL, 4, None, 'taker')
+        self.assertEqual([(fill.owner, fill.price, fill.qty, fill.side) for fill in fills],
+                         [('a', 499, 4, BUY)])
+        self.assertEqual(remaining, 0)
+        self.assertEqual(maker.qty, 6)
+        self.assertEqual(book.bids[499].qty, 11)
+        self.assertEqual(book.get_owner_orders('a')[0]['qty'], 6)
+
+    def test_sweep_multiple_levels(self):
+        book = OrderBook()
+        book.submit_limit('a', SELL, 1, 501)
+        book.submit_limit('b', SELL, 2, 502)
+        book.submit_limit('c', SELL, 3, 503)
+        fills, remaining, _ = book.match(BUY, 4, None, 'taker')
+        self.assertEqual([(fill.price, fill.qty) for fill in fills], [(501, 1), (502, 2), (503, 1)])
+        self.assertEqual(remaining, 0)
+        self.assertEqual(book.best_ask(), 503)
+        self.assertEqual(book.depth(), {'bids': [], 'asks': [[503, 2]]})
+
+    def test_limit_price_stops_sweep(self):
+        book = OrderBook()
+        book.submit_limit('a', SELL, 1, 501)
+        book.submit_limit('b', SELL, 2, 502)
+        book.submit_limit('c', SELL, 3, 503)
+        fills, order, _ = book.submit_limit('taker', BUY, 5, 502)
+        self.assertEqual([(fill.price, fill.qty) for fill in fills], [(501, 1), (502, 2)])
+        self.assertEqual((order.side, order.price, order.qty), (BUY, 502, 2))
+        self.assertEqual(book.best_bid(), 502)
+        self.assertEqual(book.best_ask(), 503)
+
+    def test_cancel_order_behind_queue_front(self):
+        book = OrderBook()
+        _, first, _ = book.submit_limit('a', BUY, 1, 499)
+        _, middle, _ = book.submit_limit('b', BUY, 2, 499)
+        _, last, _ = book.submit_limit('c', BUY, 3, 499)
+        self.assertIs(book.cancel(middle.order_id), middle)
+        self.assertIsNone(book.cancel(middle.order_id))
+        self.assertEqual(list(book.bids[499].orders), [first.order_id, last.order_id])
+        self.assertEqual(book.bids[499].qty, 4)
+        self.assertEqual(book.get_owner_orders('b'), [])
+        fills, _, _ = book.match(SELL, 4, None, 'taker')
+        self.assertEqual([fill.owner for fill in fills], ['a', 'c'])
+        self.assertIsNone(book.best_bid())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+采样分析器单元测试
+运行: python -m unittest test_sampling_profiler
+"""
+
+import re
+import threading
+import time
+import unittest
+from collections import Counter
+
+from sampling_profiler import SamplingProfiler
+
+
+def busy_worker(stop):
+    while not stop.is_set():
+        sum(range(200))
+
+
+def event_waiter(stop):
+    stop.wait()
+
+
+def sleeper(stop):
+    while not stop.is_set():
+        time.sleep(0.005)
+
+
+def lock_holder(lock, held, stop):
+    with lock:
+        held.set()
+        stop.wait()
+
+
+def lock_waiter(lock):
+    with lock:
+        pass
+
+
+class SamplingProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        held = threading.Event()
+        self.threads = [
+            threading.Thread(target=busy_worker, args=(self.stop,), name='busy'),
+            threading.Thread(target=event_waiter, args=(self.stop,), name='event-waiter'),
+            threading.Thread(target=sleeper, args=(self.stop,), name='sleeper'),
+            threading.Thread(target=lock_holder, args=(self.lock, held, self.stop), name='lock-holder'),
+        ]
+        for thread in self.threads:
+            thread.start()
+        held.wait()
+        waiter = threading.Thread(target=lock_waiter, args=(self.lock,), name='lock-waiter')
+        waiter.start()
+        self.threads.append(waiter)
+        time.sleep(0.05)  # 等待各线程进入稳定状态
+
+    def tearDown(self):
+        self.stop.set()
+        for thread in self.threads:
+            thread.join()
+
+    def sample_stacks(self, profiler, rounds=20):
+        stacks = Counter()
+        for _ in range(rounds):
+            sampled, _ = profiler._sample(threading.get_ident())
+            stacks.update(sampled)
+            time.sleep(0.002)
+        return stacks
+
+    def test_idle_filter(self):
+        stacks = self.sample_stacks(SamplingProfiler())
+        roots = {stack.split(';')[0] for stack in stacks}
+        leaves = {stack.split(';')[-1].split(' ')[0] for stack in stacks}
+        # 正在运行的线程和等待竞争锁的线程都应被采样
+        self.assertIn('busy', roots)
+        self.assertIn('lock-waiter', roots)
+        self.assertIn('lock_waiter', leaves)
+        # 阻塞在 Event.wait() 或 sleep() 的线程应被跳过
+        self.assertNotIn('event-waiter', roots)
+        self.assertNotIn('sleeper', roots)
+        self.assertNotIn('lock-holder', roots)
+
+    def test_thread_names_refresh_when_thread_count_changes(self):
+        profiler = SamplingProfiler()
+        busy = self.threads[0]
+        profiler.thread_names = {busy.ident: 'dead-thread'}
+        profiler.thread_count = 0
+        stacks = self.sample_stacks(profiler, rounds=5)
+        roots = {stack.split(';')[0] for stack in stacks}
+        self.assertIn('busy', roots)
+        self.assertNotIn('dead-thread', roots)
+
+    def test_collapsed_output_format(self):
+        profiler = SamplingProfiler()
+        profiler.thread_names = {self.threads[0].ident: 'stale'}
+        self.assertTrue(profiler.start(1))
+        self.assertNotIn('stale', profiler.thread_names.values())  # start() 清空旧的线程名缓存
+        self.assertFalse(profiler.start(1))
+        profiler.thread.join()
+        lines = profiler.collapsed().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            self.assertRegex(line, r'^\S.* \d+$')
+            stack, count = line.rsplit(' ', 1)
+            self.assertGreater(int(count), 0)
+            self.assertGreaterEqual(len(stack.split(';')), 2)
+        self.assertTrue(any(line.startswith('busy;') for line in lines))
+        self.assertFalse(any(line.startswith('stale;') for line in lines))
+
+    def test_summary_percentages(self):
+        profiler = SamplingProfiler()
+        profiler.stacks = Counter({'main;outer (a.py:1);inner (a.py:5)': 3, 'main;outer (a.py:1)': 1})
+        profiler.samples = 4
+        profiler.elapsed = 1.0
+        rows = {}
+        for line in profiler.summary().splitlines():
+            match = re.match(r'\s*([\d.]+)%\s+([\d.]+)%\s+(\d+)\s+(\d+)\s+(.+)$', line)
+            if match:
+                rows[match.group(5)] = tuple(float(value) for value in match.groups()[:4])
+        self.assertEqual(rows['inner (a.py:5)'], (75.0, 75.0, 3, 3))
+        self.assertEqual(rows['outer (a.py:1)'], (25.0, 100.0, 1, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()